@@ -2,6 +2,7 @@
 
 import sys
 import os.path
+import math
 import random
 import re
 import time
@@ -136,6 +137,9 @@ EXCLUDE_FROM_SUMMARY = (
   "behaviorspace-name",
   "run number",
 )
+# Model inputs set by BehaviorSpace (the remaining per-run fields, from
+# "morans-i" onward, are measured from the generated landscape).
+PERF_PARAMETER_FIELDS = PER_RUN_FIELDS[1:PER_RUN_FIELDS.index("morans-i")]
 
 def parse_cmdline(argv):
   desc="""\
@@ -153,6 +157,11 @@ def parse_cmdline(argv):
                       ' files (default CLUSTER_DIR/../intermediate)')
   parser.add_argument('--output-file', help='Filename of final output CSV'
                       ' (default CLUSTER_DIR/../YYYY-MM-DD_SummarizedData.csv)')
+  parser.add_argument('--perf-report-file', help='Filename of cluster '
+                      'performance report written while processing raw files'
+                      ' (default CLUSTER_DIR/../YYYY-MM-DD_PerformanceReport.txt)')
+  parser.add_argument('--slowest-runs', help='Number of slowest runs to list '
+                      'in the performance report', type=int, default=20)
   parser.add_argument('--min-cows', help='Minimum threshold required for '
                       'number of cows in any year', type=int, default=1)
   parser.add_argument('--min-harvest', help='Minimum threshold required for '
@@ -254,6 +263,15 @@ def parse_cmdline(argv):
              % args.output_file)
       sys.exit(1)
 
+  if args.perf_report_file is None:
+    args.perf_report_file = os.path.join(
+      args.cluster_dir, "..", time.strftime("%Y-%m-%d_PerformanceReport.txt"))
+    if (os.path.exists(args.perf_report_file) and not args.overwrite and
+        args.stage in ("raw-to-int", "all")):
+      print ("ERROR: File %r already exists!\n  (use --overwrite to overwrite)"
+             % args.perf_report_file)
+      sys.exit(1)
+
   return args
 
 
@@ -300,10 +318,13 @@ def verify_tests_pass_and_get_filenames(args):
 def make_intermediate_files(args, filenames):
   print "INFO: Making intermediate files from %d raw source files" % len(filenames)
   all_per_run_data, all_per_year_data = {}, {}
+  perf_records = []
   with open(os.path.join(args.intermediate_dir, "INDEX"), "w") as f:
     f.write("Run ID,PerRunDataFile,PerYearDataFile\n")
     for filename in filenames:
       per_run_data, per_year_data = read_raw_file(filename)
+      perf_records.extend(
+        run_performance_records(per_run_data, per_year_data))
       if not args.huge:
         all_per_run_data.update(per_run_data)
         all_per_year_data.update(per_year_data)
@@ -314,6 +335,7 @@ def make_intermediate_files(args, filenames):
       del per_run_data
       del per_year_data
 
+  write_performance_report(args, perf_records)
   return (None, None) if args.huge else (all_per_run_data, all_per_year_data)
 
 
@@ -440,6 +462,143 @@ def write_intermediate_data(args, per_run_data, per_year_data):
   return id_filenames_list
 
 
+def run_performance_records(per_run_data, per_year_data):
+  # Keep only what the performance report needs, so that records for every
+  # run can be held in memory even when running with --huge.
+  records = []
+  for run_id in sorted(per_run_data.keys()):
+    final_year = max(per_year_data[run_id].keys())
+    setup_time = float(per_run_data[run_id]["model-setup-time"])
+    # timer is cumulative, so the final year's value is the whole run
+    run_time = float(per_year_data[run_id][final_year]["timer"])
+    records.append({
+      "Run ID": run_id,
+      "behaviorspace-name": per_run_data[run_id]["behaviorspace-name"],
+      "parameters": tuple(per_run_data[run_id][field]
+                          for field in PERF_PARAMETER_FIELDS),
+      "setup-time": setup_time,
+      "run-time": run_time,
+      "total-time": setup_time + run_time,
+    })
+  return records
+
+
+def percentile(sorted_values, pct):
+  # nearest-rank percentile of an already-sorted, non-empty list
+  rank = int(math.ceil(pct / 100.0 * len(sorted_values)))
+  return sorted_values[max(rank, 1) - 1]
+
+
+def time_distribution(values):
+  values = sorted(values)
+  return (sum(values), percentile(values, 50), percentile(values, 95),
+          values[-1])
+
+
+def pearson_correlation(xs, ys):
+  n = len(xs)
+  mean_x = sum(xs) / float(n)
+  mean_y = sum(ys) / float(n)
+  cov = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys))
+  var_x = sum((x - mean_x) ** 2 for x in xs)
+  var_y = sum((y - mean_y) ** 2 for y in ys)
+  if var_x == 0 or var_y == 0:
+    return None
+  return cov / (var_x * var_y) ** 0.5
+
+
+def numeric_parameter_value(value):
+  if value in ("true", "false"):
+    return 1.0 if value == "true" else 0.0
+  if isinstance(value, (int, float)):
+    return float(value)
+  return None
+
+
+def write_performance_report(args, perf_records):
+  if not perf_records:
+    print "WARNING: No runs found, not writing performance report"
+    return
+
+  # Parameters that don't vary across runs only add noise to the report.
+  varying_fields = [
+    field for i, field in enumerate(PERF_PARAMETER_FIELDS)
+    if len(set(rec["parameters"][i] for rec in perf_records)) > 1]
+  varying_indexes = [PERF_PARAMETER_FIELDS.index(field)
+                     for field in varying_fields]
+
+  def group_rows(key_func):
+    groups = {}
+    for rec in perf_records:
+      groups.setdefault(key_func(rec), []).append(rec)
+    rows = []
+    for key, recs in groups.items():
+      setup = time_distribution([rec["setup-time"] for rec in recs])
+      run = time_distribution([rec["run-time"] for rec in recs])
+      rows.append((setup[0] + run[0], key, len(recs), setup, run))
+    rows.sort(reverse=True)
+    return rows
+
+  def write_group_table(outf, title, rows):
+    outf.write("%s (sorted by total time)\n" % title)
+    outf.write("%8s %10s | %10s %9s %9s %9s | %10s %9s %9s %9s | %s\n" % (
+      "runs", "total (h)", "setup (s)", "p50", "p95", "max",
+      "run (s)", "p50", "p95", "max", "group"))
+    for total, key, n_runs, setup, run in rows:
+      outf.write(
+        "%8d %10.2f | %10.1f %9.2f %9.2f %9.2f | %10.1f %9.2f %9.2f %9.2f"
+        " | %s\n" % ((n_runs, total / 3600.0) + setup + run + (key,)))
+    outf.write("\n")
+
+  def combination_label(rec):
+    label = ", ".join("%s=%s" % (PERF_PARAMETER_FIELDS[i], rec["parameters"][i])
+                      for i in varying_indexes)
+    return "%s: %s" % (rec["behaviorspace-name"], label or "(all runs)")
+
+  print "INFO: Writing performance report to %r" % args.perf_report_file
+  with open(args.perf_report_file, "w") as outf:
+    setup = time_distribution([rec["setup-time"] for rec in perf_records])
+    run = time_distribution([rec["run-time"] for rec in perf_records])
+    outf.write("Runs: %d\n" % len(perf_records))
+    outf.write("Total setup time: %.2f h (p50 %.2f s, p95 %.2f s, max %.2f s)\n"
+               % ((setup[0] / 3600.0,) + setup[1:]))
+    outf.write("Total run time: %.2f h (p50 %.2f s, p95 %.2f s, max %.2f s)\n"
+               % ((run[0] / 3600.0,) + run[1:]))
+    outf.write("Total time: %.2f h\n\n" % ((setup[0] + run[0]) / 3600.0))
+
+    write_group_table(outf, "Per behaviorspace",
+                      group_rows(lambda rec: rec["behaviorspace-name"]))
+    write_group_table(outf, "Per parameter combination",
+                      group_rows(combination_label))
+
+    slowest = sorted(perf_records, key=lambda rec: rec["total-time"],
+                     reverse=True)[:args.slowest_runs]
+    outf.write("Slowest %d runs\n" % len(slowest))
+    outf.write("%10s %10s %10s | %s\n" % (
+      "total (s)", "setup (s)", "run (s)", "run"))
+    for rec in slowest:
+      outf.write("%10.2f %10.2f %10.2f | %s (%s)\n" % (
+        rec["total-time"], rec["setup-time"], rec["run-time"], rec["Run ID"],
+        combination_label(rec)))
+    outf.write("\n")
+
+    correlations = []
+    for field, i in zip(varying_fields, varying_indexes):
+      xs = [numeric_parameter_value(rec["parameters"][i])
+            for rec in perf_records]
+      if None in xs:
+        continue
+      r = pearson_correlation(xs, [rec["total-time"] for rec in perf_records])
+      if r is not None:
+        correlations.append((abs(r), r, field))
+    correlations.sort(reverse=True)
+    outf.write("Correlation of parameters with total time (Pearson r)\n")
+    for _, r, field in correlations:
+      outf.write("%+7.3f  %s\n" % (r, field))
+    if not correlations:
+      outf.write("  (no numeric parameters vary across runs)\n")
+
+
 def read_intermediate_files(args):
   filedata = {}
   with open(os.path.join(args.intermediate_dir, "INDEX")) as f: